@@ -1,13 +1,63 @@
-import json
-import psycopg2
-from psycopg2.extras import execute_values
+from psycopg_pool import ConnectionPool
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+from itertools import islice
+
+from collector.utils.tracklist_files import iter_saved_tracklists
 
 load_dotenv()
 
+BATCH_SIZE = 100  # Tracklists inserted per round-trip
+POOL_SIZE = 8  # Connections loading batches concurrently
+
+def insert_tracklists(cur, tracklists, parsed_at):
+    """Insert a batch of tracklists and all of their tracks."""
+    # Insert the tracklists in a single pipelined batch. executemany prepares
+    # the INSERT once as a server-side statement and only binds each row, so
+    # it is parsed and planned once per connection rather than per tracklist.
+    # The generated IDs come back as one result set per row, in the order the
+    # rows were sent
+    with cur.connection.pipeline():
+        cur.executemany(
+            """
+            INSERT INTO one_thousand_one.tracklist (url, parsed_at)
+            VALUES (%s, %s)
+            RETURNING id
+            """,
+            [(tracklist['url'], parsed_at) for tracklist in tracklists],
+            returning=True
+        )
+    tracklist_ids = [cur.fetchone()[0] for _ in cur.results()]
+
+    # Bulk load the tracks of every tracklist in the batch through one COPY
+    with cur.copy(
+        """
+        COPY one_thousand_one.track
+            (tracklist_id, title, artist, played_together,
+             is_mashup_element, track_number, position)
+        FROM STDIN
+        """
+    ) as copy:
+        for tracklist_id, tracklist in zip(tracklist_ids, tracklists):
+            for position, track in enumerate(tracklist['tracks'], 1):
+                copy.write_row((
+                    tracklist_id,  # Link to parent tracklist
+                    track.get('title', 'Unknown Title'),
+                    track.get('artist', ['Unknown Artist']),
+                    track.get('played_together', False),
+                    track.get('is_mashup_element', False),
+                    track.get('track_number', None),
+                    position  # 1-based position in tracklist
+                ))
+
+def load_batch(pool, tracklists, parsed_at):
+    """Insert a batch of tracklists on a pooled connection and commit it."""
+    with pool.connection() as conn, conn.cursor() as cur:
+        insert_tracklists(cur, tracklists, parsed_at)
+
 def load_tracklists():
     """
     Load tracklists and their tracks into PostgreSQL database.
@@ -27,88 +77,76 @@ def load_tracklists():
       * is_mashup_element: Boolean indicating if part of a mashup
       * track_number: Unique number for each occurrence of track in a tracklist
       * position: Position in the tracklist (1-based)
+      * Indexed on tracklist_id for joins back to the tracklist
     
     Reference Propagation:
-    1. When a tracklist is inserted, PostgreSQL generates a unique ID
-    2. This ID is returned via RETURNING clause
-    3. The ID is then used as tracklist_id for all tracks from that tracklist
+    1. Tracklists are inserted a batch at a time, PostgreSQL generates their IDs
+    2. The IDs are returned via RETURNING clause, pipelined per batch
+    3. Each ID is then used as tracklist_id for all tracks from that
+       tracklist, which are bulk loaded with one COPY per batch
     4. This maintains the parent-child relationship between tracklist and tracks
+
+    Batches are loaded concurrently over a connection pool, each one in its
+    own transaction, with synchronous_commit turned off for the session.
     """
-    conn = psycopg2.connect(
-        dbname=os.getenv('DB_NAME'),
-        user=os.getenv('DB_USER'),
-        password=os.getenv('DB_PASSWORD'),
-        host=os.getenv('DB_HOST', 'localhost')
-    )
-    cur = conn.cursor()
+    with ConnectionPool(
+        kwargs={
+            'dbname': os.getenv('DB_NAME'),
+            'user': os.getenv('DB_USER'),
+            'password': os.getenv('DB_PASSWORD'),
+            'host': os.getenv('DB_HOST', 'localhost'),
+            # Don't wait for the WAL flush on each batch commit; a crash can
+            # lose the last few commits but never corrupts the database
+            'options': '-c synchronous_commit=off'
+        },
+        min_size=POOL_SIZE,
+        max_size=POOL_SIZE
+    ) as pool:
+        # Create schema with tables if they don't exist, committed before any
+        # batch is loaded
+        with pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS one_thousand_one.tracklist (
+                    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    parsed_at TIMESTAMP
+                );
 
-    # Create schema with tables if they don't exist
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS one_thousand_one.tracklist (
-            id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
-            url TEXT NOT NULL,
-            parsed_at TIMESTAMP
-        );
+                CREATE TABLE IF NOT EXISTS one_thousand_one.track (
+                    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+                    tracklist_id INTEGER REFERENCES one_thousand_one.tracklist(id),
+                    title TEXT NOT NULL,
+                    artist TEXT[] NOT NULL,
+                    played_together BOOLEAN NOT NULL,
+                    is_mashup_element BOOLEAN NOT NULL,
+                    track_number TEXT,
+                    position INTEGER NOT NULL
+                );
+            """)
 
-        CREATE TABLE IF NOT EXISTS one_thousand_one.track (
-            id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
-            tracklist_id INTEGER REFERENCES one_thousand_one.tracklist(id),
-            title TEXT NOT NULL,
-            artist TEXT[] NOT NULL,
-            played_together BOOLEAN NOT NULL,
-            is_mashup_element BOOLEAN NOT NULL,
-            track_number TEXT,
-            position INTEGER NOT NULL
-        );
-    """)
-    
-    # Load tracklists from JSON file
-    with open('./raw_data/tracklists.json') as f:
-        tracklists = json.load(f)
-        
-    for tracklist in tracklists:
-        # Insert tracklist and get its generated ID
-        cur.execute(
-            """
-            INSERT INTO one_thousand_one.tracklist (url, parsed_at)
-            VALUES (%s, %s)
-            RETURNING id
-            """,
-            (tracklist['url'], datetime.now())
-        )
-        tracklist_id = cur.fetchone()[0]
-            
-        # Enumerate tracks in tracklist and prepare data for batch insertion
-        track_values = [
-            (
-                tracklist_id,  # Link to parent tracklist
-                track.get('title', 'Unknown Title'),
-                track.get('artist', ['Unknown Artist']),
-                track.get('played_together', False),
-                track.get('is_mashup_element', False),
-                track.get('track_number', None),
-                position  # 1-based position in tracklist
-            )
-            for position, track in enumerate(tracklist['tracks'], 1)
-        ]
-        
-        # Batch insert all tracks for this tracklist
-        if track_values:
-            execute_values(
-                cur,
-                """
-                INSERT INTO one_thousand_one.track 
-                    (tracklist_id, title, artist, played_together, 
-                     is_mashup_element, track_number, position)
-                VALUES %s
-                """,
-                track_values
-            )
-    
-    # Commit all changes and clean up
-    conn.commit()
-    cur.close()
-    conn.close()
+        # Stream tracklists from both spiders' JSON Lines files in batches.
+        # Batches are independent, so each one is loaded and committed on its
+        # own pooled connection, with at most POOL_SIZE batches held in memory
+        tracklists = iter_saved_tracklists()
+        parsed_at = datetime.now()
+        with ThreadPoolExecutor(POOL_SIZE) as executor:
+            pending = set()
+            while batch := list(islice(tracklists, BATCH_SIZE)):
+                if len(pending) >= POOL_SIZE:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()  # Re-raise errors from the worker
+                pending.add(executor.submit(load_batch, pool, batch, parsed_at))
+            for future in pending:
+                future.result()
+
+        # Index tracks by their tracklist after the bulk load, so a new table
+        # builds the index once instead of maintaining it on every COPY
+        with pool.connection() as conn:
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS track_tracklist_id_idx
+                ON one_thousand_one.track (tracklist_id)
+            """)
 
 if __name__ == '__main__':
     load_tracklists()
\ No newline at end of file
@@ -1,51 +1,99 @@
+import logging
+import re
+
+import orjson
 import scrapy
+from selectolax.lexbor import LexborHTMLParser
 from pathlib import Path
-import json
+
+from collector.tracklist_parser import parse_event_name, parse_tracks
+
+# Tracklist entries on the DJ's tracklist index page, and their titles. Kept
+# as XPath so parsel doesn't translate them from CSS on every call
+TRACKLIST_DIV_XPATH = (
+    '//div[contains(concat(" ", normalize-space(@class), " "), " bItm ")'
+    ' and contains(concat(" ", normalize-space(@class), " "), " action ")'
+    ' and contains(concat(" ", normalize-space(@class), " "), " oItm ")]'
+)
+TRACKLIST_TITLE_XPATH = './/div[contains(concat(" ", normalize-space(@class), " "), " bTitle ")]//a/text()'
+
+# Tracklist path quoted in an index entry's onclick handler
+ONCLICK_URL_RE = re.compile(r"'([^']+)'")
 
 class TracklistsSpider(scrapy.Spider):
     name = 'stable_prydz_tracklists_spider'
     allowed_domains = ['1001tracklists.com']
 
-    # Add delay settings
+    # Throttling settings: AutoThrottle paces requests to the server's latency
+    # and backs off when it slows down or errors, instead of a fixed delay
     custom_settings = {
-        'DOWNLOAD_DELAY': 2,  # 2 second delay between requests
-        'RANDOMIZE_DOWNLOAD_DELAY': True,  # Randomize the delay
-        'CONCURRENT_REQUESTS': 1,  # Only make one request at a time
+        'DOWNLOAD_DELAY': 0,  # No fixed floor under AutoThrottle's delay
+        'CONCURRENT_REQUESTS': 8,  # Overlap requests instead of one at a time
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 4,  # Stay polite to 1001tracklists
+        'AUTOTHROTTLE_ENABLED': True,  # Tune the delay to server latency
+        'AUTOTHROTTLE_START_DELAY': 1.0,
+        'AUTOTHROTTLE_TARGET_CONCURRENCY': 2.0,
         'RETRY_TIMES': 3,  # Retry failed requests up to 3 times
         'RETRY_HTTP_CODES': [500, 502, 503, 504, 400, 403, 404, 408],
+        # One compact tracklist per line, appended as a new gzip member on each
+        # run, so nothing is rewritten and the file stays a valid gzip stream
         'FEEDS': {
-            'raw_data/tracklists.json': {
-                'format': 'json',
+            'raw_data/tracklists.jsonl.gz': {
+                'format': 'jsonlines',
                 'encoding': 'utf8',
                 'store_empty': False,
                 'overwrite': False,  # Don't overwrite, append instead
-                'indent': 2
+                'postprocessing': ['scrapy.extensions.postprocessing.GzipPlugin'],
             },
         },
     }
 
+    # Browser-like request headers, shared by every request
+    _HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Upgrade-Insecure-Requests': '1',
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'none',
+        'Sec-Fetch-User': '?1',
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.state_file = Path('raw_data/scrape_state.json')
+        self.state_file = Path('raw_data/scrape_state.log')
         self.scraped_urls = self.load_state()
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        self.state_fp = open(self.state_file, 'a', encoding='utf-8', buffering=1)
         self.logger.info(f"Loaded {len(self.scraped_urls)} previously scraped URLs")
 
     def load_state(self):
-        """Load the set of already scraped URLs."""
+        """Load the set of already scraped URLs from the append-only log."""
         if self.state_file.exists():
-            with open(self.state_file) as f:
-                return set(json.load(f))
+            with open(self.state_file, encoding='utf-8') as f:
+                return {line.strip() for line in f if line.strip()}
+        # Earlier runs kept the URLs in a JSON list; seed the log from it once
+        legacy_file = self.state_file.with_suffix('.json')
+        if legacy_file.exists():
+            with open(legacy_file, 'rb') as f:
+                scraped_urls = set(orjson.loads(f.read()))
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                f.writelines(url + '\n' for url in scraped_urls)
+            return scraped_urls
         return set()
 
-    def save_state(self):
-        """Save the set of scraped URLs."""
-        with open(self.state_file, 'w') as f:
-            json.dump(list(self.scraped_urls), f)
+    def save_state(self, url):
+        """Mark a URL as scraped by appending it to the log."""
+        self.scraped_urls.add(url)
+        self.state_fp.write(url + '\n')
 
     def closed(self, reason):
-        """Save state when spider closes."""
-        self.save_state()
-    
+        """Close the state log when spider closes."""
+        self.state_fp.close()
+
     def errback_httpbin(self, failure):
         self.logger.error(f"Request failed: {failure.value}")
     
@@ -54,97 +102,74 @@ class TracklistsSpider(scrapy.Spider):
         
         yield scrapy.Request(
             url=search_url,
-            headers=self.get_headers(),
+            headers=self._HEADERS,
             callback=self.parse_search_results,
             errback=self.errback_httpbin,
-            dont_filter=True
+            dont_filter=True  # The index is refetched every run for new tracklists
         )
 
     def parse_search_results(self, response):
         # First, let's debug what we're getting
-        self.logger.info(f"Response status: {response.status}")
-        self.logger.info(f"Response URL: {response.url}")
+        self.logger.debug("Response status: %s", response.status)
+        self.logger.debug("Response URL: %s", response.url)
     
-        # Let's see what HTML we're getting
-        with open('debug.html', 'w') as f:
-            f.write(response.text)
+        # Let's see what HTML we're getting (opt-in, it's a disk write per page)
+        if self.settings.getbool('DEBUG_DUMP_HTML'):
+            with open('debug.html', 'w') as f:
+                f.write(response.text)
 
-        tracklist_divs = response.css('div.bItm.action.oItm')
+        tracklist_divs = response.xpath(TRACKLIST_DIV_XPATH)
         self.logger.info(f"Found {len(tracklist_divs)} tracklist divs")
 
         new_tracklists_found = 0
+        debug = self.logger.isEnabledFor(logging.DEBUG)
         
         for div in tracklist_divs:
-            onclick = div.attrib.get('onclick', '')
-            url_match = onclick.split("'")[1] if "'" in onclick else None
+            url_match = ONCLICK_URL_RE.search(div.attrib.get('onclick', ''))
             
             if url_match:
-                full_url = f'https://www.1001tracklists.com{url_match}'
+                full_url = f'https://www.1001tracklists.com{url_match.group(1)}'
                 
                 # Skip if already scraped
                 if full_url in self.scraped_urls:
-                    self.logger.info(f"Skipping already scraped URL: {full_url}")
+                    if debug:
+                        self.logger.debug("Skipping already scraped URL: %s", full_url)
                     continue
                 
                 new_tracklists_found += 1
-                self.scraped_urls.add(full_url)
                 
-                title = div.css('div.bTitle a::text').get()
-                self.logger.info(f"Found new tracklist: {title}")
+                title = div.xpath(TRACKLIST_TITLE_XPATH).get()
+                if debug:
+                    self.logger.debug("Found new tracklist: %s", title)
                 
                 yield scrapy.Request(
                     url=full_url,
                     callback=self.parse_tracklist,
                     errback=self.errback_httpbin,
-                    headers=self.get_headers(),
+                    headers=self._HEADERS,
                     dont_filter=True,
-                    meta={'title': title}
+                    meta={'title': title, 'tracklist_url': full_url}
                 )
         
-        # Save state after processing all tracklists
-        self.save_state()
-        
         if new_tracklists_found == 0:
             self.logger.info("No new tracklists found")
         else:
             self.logger.info(f"Found {new_tracklists_found} new tracklists")
 
     def parse_tracklist(self, response):
-        event_name = response.css('meta[property="og:title"]::attr(content)').get()
+        tree = LexborHTMLParser(response.text)
+        event_name = parse_event_name(tree)
 
         # Add logging for debugging
-        self.logger.info(f"Parsing tracklist: {event_name}")
-        self.logger.info(f"URL: {response.url}")
+        self.logger.debug("Parsing tracklist: %s", event_name)
+        self.logger.debug("URL: %s", response.url)
         
-        tracks = []
-        track_numbers = set()
-        
-        for track_div in response.css('div[id^="tlp"]:not([id$="_content"])'):
-            track_number = track_div.attrib.get('id', '').replace('tlp', '')
-            track_index = track_div.attrib.get('data-trno', '')
-            
-            if track_number in track_numbers:
-                continue
-            track_numbers.add(track_number)
-            
-            is_mashup_element = 'data-mashpos' in track_div.attrib
-            played_together = track_div.css(f'span#tlp{track_index}_tracknumber_value[title="played together with previous track"]::attr(title)').get()
-            
-            track_data = {
-                'title': track_div.css('meta[itemprop="name"]::attr(content)').get(),
-                'time': track_div.css('.cueValueField::text').get(),
-                'artist': track_div.css('meta[itemprop="byArtist"]::attr(content)').getall(),
-                'record_label': track_div.css('meta[itemprop="recordLabel"]::attr(content)').get(),
-                'played_together': bool(played_together),
-                'is_mashup_element': is_mashup_element,
-                'track_number': track_number
-            }
-            
-            track_data = {k: v.strip() if isinstance(v, str) and k not in ['played_together', 'is_mashup_element', 'track_number'] else v 
-                         for k, v in track_data.items() if v is not None}
-            
-            if track_data:
-                tracks.append(track_data)
+        tracks = parse_tracks(tree)
+        if not tracks:
+            # Most likely a CAPTCHA or an empty page; left unmarked so it's
+            # retried next run, and kept out of the feed
+            self.logger.warning(f"No tracks found on {response.url}")
+            return
 
         result = {
             'event': event_name,
@@ -154,17 +179,7 @@ class TracklistsSpider(scrapy.Spider):
         
         self.logger.info(f"Successfully parsed {len(tracks)} tracks from {event_name}")
         yield result
-
-    def get_headers(self):
-        return {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-        }
\ No newline at end of file
+        
+        # Only mark the tracklist scraped once it's parsed, so a crawl that dies
+        # mid-run retries the pages it hadn't reached yet
+        self.save_state(response.meta.get('tracklist_url', response.url))
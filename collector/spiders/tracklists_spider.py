@@ -1,15 +1,41 @@
 #!/usr/bin/env python3
 
 import asyncio
-import json
+import logging
 from pathlib import Path
 import random
+import re
 from typing import Dict, List, Optional, Set
 from datetime import datetime
 
+import httpx
+import orjson
 from playwright.async_api import async_playwright, Page
+from selectolax.lexbor import LexborHTMLParser
 from tqdm import tqdm
 
+from collector.tracklist_parser import TRACK_DIV_SELECTOR, parse_event_name, parse_tracks
+from collector.utils.browser import block_unneeded_requests
+from collector.utils.tracklist_files import iter_saved_tracklists
+
+logger = logging.getLogger(__name__)
+
+# Headers for fetching pages without a browser, matching the browser context
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+FETCH_CONCURRENCY = 4  # Pages fetched at once without a browser
+FETCH_DELAY = (1.0, 3.0)  # Random pause in seconds after each fetch, per slot
+
+# Statuses the site answers with when it's blocking or rate limiting us
+BLOCKED_STATUS_CODES = {403, 429, 503}
+
+# Same indicators check_for_captcha looks for in the rendered page: captcha
+# iframes, any class containing "captcha" (which covers g-recaptcha) and #captcha
+CAPTCHA_MARKERS = re.compile(r'<iframe[^>]+src="[^"]*captcha|class="[^"]*captcha|id="captcha"', re.IGNORECASE)
+
 class TracklistsSpider:
     """Spider to parse tracklist pages from 1001tracklists.com"""
     
@@ -18,75 +44,64 @@ class TracklistsSpider:
         Path('raw_data').mkdir(exist_ok=True)
         
         self.urls_file = Path('raw_data/tracklist_urls.json')
-        self.processed_file = Path('raw_data/processed_urls.json')
-        self.output_file = Path('raw_data/tracklists.json')
+        self.processed_file = Path('raw_data/processed_urls.log')
+        self.output_file = Path('raw_data/tracklists.jsonl')
         
-        # Initialize state files if they don't exist
-        if not self.processed_file.exists():
-            with open(self.processed_file, 'w') as f:
-                json.dump([], f)
-        if not self.output_file.exists():
-            with open(self.output_file, 'w') as f:
-                json.dump([], f)
-                
         self.processed_urls = self.load_processed()
         
-        # Also load URLs from existing tracklists
-        existing_tracklists = self.load_existing_tracklists()
-        for tracklist in existing_tracklists:
-            if 'url' in tracklist:
-                self.processed_urls.add(tracklist['url'])
+        # Scan existing tracklists once; saves are deduplicated against this set
+        # instead of re-reading the output file
+        self.saved_urls = {
+            tracklist['url'] for tracklist in self.load_existing_tracklists()
+            if 'url' in tracklist
+        }
+        self.processed_urls.update(self.saved_urls)
         
-        print(f"Already processed {len(self.processed_urls)} URLs (from processed_urls.json and tracklists.json)")
+        # Tracklists are appended one JSON document per line, processed URLs
+        # one URL per line
+        self.out_fp = open(self.output_file, 'ab', buffering=0)
+        self.processed_fp = open(self.processed_file, 'a', encoding='utf-8', buffering=1)
+        
+        print(f"Already processed {len(self.processed_urls)} URLs (from processed_urls.log and saved tracklists)")
     
     def load_processed(self) -> Set[str]:
-        """Load the set of already processed URLs."""
+        """Load the set of already processed URLs from the append-only log."""
         if self.processed_file.exists():
-            with open(self.processed_file) as f:
-                return set(json.load(f))
+            with open(self.processed_file, encoding='utf-8') as f:
+                return {line.strip() for line in f if line.strip()}
         return set()
     
-    def save_processed(self):
-        """Save the set of processed URLs."""
-        with open(self.processed_file, 'w') as f:
-            json.dump(list(self.processed_urls), f, indent=2)
+    def save_processed(self, url: str):
+        """Mark a URL as processed by appending it to the log."""
+        self.processed_urls.add(url)
+        self.processed_fp.write(url + '\n')
     
     def load_existing_tracklists(self) -> List[Dict]:
-        """Load existing tracklists from the output file."""
-        if self.output_file.exists():
-            try:
-                with open(self.output_file) as f:
-                    existing = json.load(f)
-                print(f"\nLoaded {len(existing)} existing tracklists")
-                return existing
-            except json.JSONDecodeError:
-                print("\nWarning: Could not parse existing tracklists.json, starting fresh")
-                return []
-            except Exception as e:
-                print(f"\nError loading existing tracklists: {e}")
-                return []
-        return []
+        """Load existing tracklists saved by either spider."""
+        try:
+            existing = list(iter_saved_tracklists())
+            print(f"\nLoaded {len(existing)} existing tracklists")
+            return existing
+        except orjson.JSONDecodeError:
+            print("\nWarning: Could not parse existing tracklists, starting fresh")
+            return []
+        except Exception as e:
+            print(f"\nError loading existing tracklists: {e}")
+            return []
     
     def save_tracklist(self, tracklist: Dict):
         """Append a tracklist to the output file."""
         try:
-            # Load existing tracklists
-            tracklists = self.load_existing_tracklists()
-            
             # Check if this URL is already in the tracklists
-            existing_urls = {t['url'] for t in tracklists}
-            if tracklist['url'] in existing_urls:
+            if tracklist['url'] in self.saved_urls:
                 print(f"\nSkipping already parsed tracklist: {tracklist['url']}")
                 return
             
-            # Append new tracklist
-            tracklists.append(tracklist)
-            
-            # Save back to file
-            with open(self.output_file, 'w') as f:
-                json.dump(tracklists, f, indent=2)
+            # Append new tracklist as a single line
+            self.out_fp.write(orjson.dumps(tracklist) + b'\n')
+            self.saved_urls.add(tracklist['url'])
             print(f"\nSaved new tracklist: {tracklist['url']}")
-            print(f"Total tracklists saved: {len(tracklists)}")
+            print(f"Total tracklists saved: {len(self.saved_urls)}")
             
         except Exception as e:
             print(f"\nError saving tracklist: {e}")
@@ -140,7 +155,7 @@ class TracklistsSpider:
                     # Wait for either the title meta tag or tracklistTitle element
                     await page.wait_for_selector('meta[property="og:title"], .tracklistTitle', timeout=10000)
                     # Wait for track divs
-                    await page.wait_for_selector('div[id^="tlp"]:not([id$="_content"])', timeout=5000)
+                    await page.wait_for_selector(TRACK_DIV_SELECTOR, timeout=5000)
                     return True
                 except Exception:
                     pass
@@ -174,109 +189,33 @@ class TracklistsSpider:
                     print("Failed to load page after CAPTCHA")
                     return None
             
-            # Get event name - try both methods in parallel
-            title_meta = page.query_selector('meta[property="og:title"]')
-            title_el = page.query_selector('.tracklistTitle')
-            results = await asyncio.gather(title_meta, title_el)
+            # Debug: Print page title (skips the CDP call unless debugging)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Page title: %s", await page.title())
+            
+            # Parse a snapshot of the rendered page with the same extractor as
+            # the HTTP path, one CDP call instead of one per element
+            return self.parse_tracklist_html(await page.content(), url)
             
-            event_name = None
-            if results[0]:  # meta tag
-                event_name = await results[0].get_attribute('content')
-            elif results[1]:  # title element
-                event_name = await results[1].inner_text()
+        except Exception as e:
+            print(f"Error parsing tracklist {url}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def parse_tracklist_html(self, html: str, url: str) -> Optional[Dict]:
+        """Parse the HTML of a tracklist page with selectolax."""
+        try:
+            tree = LexborHTMLParser(html)
             
+            event_name = parse_event_name(tree)
             if not event_name:
                 print("Error: Could not find event name")
                 return None
             
             print(f"Found event: {event_name}")
             
-            # Get page title
-            title = await page.title()
-            print(f"Page title: {title}")
-            
-            # Debug: Print page title
-            print(f"Page title: {await page.title()}")
-            
-            tracks = []
-            track_numbers = set()
-            
-            # Find all track divs
-            track_divs = await page.query_selector_all('div[id^="tlp"]:not([id$="_content"])')
-            print(f"Found {len(track_divs)} potential track divs")
-            
-            for track_div in track_divs:
-                try:
-                    # Get track number and index
-                    track_number = await track_div.get_attribute('id')
-                    if track_number:
-                        track_number = track_number.replace('tlp', '')
-                        print(f"\nProcessing track number: {track_number}")
-                    else:
-                        print("Warning: Track div has no ID")
-                        continue
-                    
-                    track_index = await track_div.get_attribute('data-trno')
-                    print(f"Track index: {track_index}")
-                    
-                    if track_number in track_numbers:
-                        print(f"Skipping duplicate track number: {track_number}")
-                        continue
-                    track_numbers.add(track_number)
-                    
-                    # Check for mashup and played together
-                    is_mashup = await track_div.get_attribute('data-mashpos') is not None
-                    played_together_el = await page.query_selector(f'span#tlp{track_index}_tracknumber_value[title="played together with previous track"]')
-                    played_together = played_together_el is not None
-                    
-                    # Get track metadata with error handling
-                    title = None
-                    title_meta = await track_div.query_selector('meta[itemprop="name"]')
-                    if title_meta:
-                        title = await title_meta.get_attribute('content')
-                    
-                    time = None
-                    time_el = await track_div.query_selector('.cueValueField')
-                    if time_el:
-                        time = await time_el.inner_text()
-                    
-                    artists = []
-                    artist_metas = await track_div.query_selector_all('meta[itemprop="byArtist"]')
-                    for artist_meta in artist_metas:
-                        artist = await artist_meta.get_attribute('content')
-                        if artist:
-                            artists.append(artist)
-                    
-                    label = None
-                    label_meta = await track_div.query_selector('meta[itemprop="recordLabel"]')
-                    if label_meta:
-                        label = await label_meta.get_attribute('content')
-                    
-                    print(f"Found track: {title} by {artists}")
-                    
-                    track_data = {
-                        'title': title.strip() if title else None,
-                        'time': time.strip() if time else None,
-                        'artist': artists,
-                        'record_label': label.strip() if label else None,
-                        'played_together': played_together,
-                        'is_mashup_element': is_mashup,
-                        'track_number': track_number
-                    }
-                    
-                    # Clean up None values and strip strings
-                    track_data = {k: v for k, v in track_data.items() if v is not None}
-                    
-                    if track_data:
-                        tracks.append(track_data)
-                        print(f"Added track: {track_data}")
-                    else:
-                        print("Warning: Empty track data")
-                        
-                except Exception as e:
-                    print(f"Error parsing track: {e}")
-                    continue
-            
+            tracks = parse_tracks(tree)
             if not tracks:
                 print("Error: No tracks found")
                 return None
@@ -296,7 +235,56 @@ class TracklistsSpider:
             import traceback
             traceback.print_exc()
             return None
-    
+
+    async def fetch_tracklist(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str) -> Optional[Dict]:
+        """Fetch and parse a tracklist over HTTP; None if blocked or failed."""
+        async with semaphore:
+            # Once the site blocks us, leave the rest to the browser
+            if self.blocked:
+                return None
+            try:
+                response = await client.get(url)
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                print(f"\nHTTP fetch failed for {url}: {e}")
+                if e.response.status_code in BLOCKED_STATUS_CODES:
+                    print("Blocked by the site, switching to the browser")
+                    self.blocked = True
+                return None
+            except httpx.HTTPError as e:
+                print(f"\nHTTP fetch failed for {url}: {e}")
+                return None
+            finally:
+                # Pace requests like the browser loop does, while holding the slot
+                await asyncio.sleep(random.uniform(*FETCH_DELAY))
+        
+        if CAPTCHA_MARKERS.search(response.text):
+            print(f"\nCAPTCHA served for {url}, switching to the browser")
+            self.blocked = True
+            return None
+        print(f"\nParsing: {url}")
+        tracklist = self.parse_tracklist_html(response.text, url)
+        if tracklist is None:
+            # Most likely a challenge page served with a 200
+            print("Unparseable page, switching to the browser")
+            self.blocked = True
+        return tracklist
+
+    async def fetch_without_browser(self, urls: List[str]) -> List[str]:
+        """Fetch tracklists over HTTP/2 and return the URLs left for the browser."""
+        self.blocked = False
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+        async with httpx.AsyncClient(http2=True, headers=HTTP_HEADERS, timeout=30, follow_redirects=True) as client:
+            fetches = [self.fetch_tracklist(client, semaphore, url) for url in urls]
+            with tqdm(total=len(urls), desc="Fetching tracklists") as pbar:
+                for fetch in asyncio.as_completed(fetches):
+                    tracklist = await fetch
+                    if tracklist:
+                        self.save_tracklist(tracklist)
+                        self.save_processed(tracklist['url'])
+                    pbar.update(1)
+        return [url for url in urls if url not in self.processed_urls]
+
     async def run(self):
         """Run the spider to parse all tracklists"""
         try:
@@ -305,8 +293,8 @@ class TracklistsSpider:
                 print("No URLs file found at", self.urls_file)
                 return
                 
-            with open(self.urls_file, 'r') as f:
-                relative_urls = json.load(f)
+            with open(self.urls_file, 'rb') as f:
+                relative_urls = orjson.loads(f.read())
             
             # Convert relative URLs to absolute URLs
             urls = [f"https://www.1001tracklists.com{url}" for url in relative_urls]
@@ -319,6 +307,15 @@ class TracklistsSpider:
                 print("No new URLs to process")
                 return
             
+            # Fast path: fetch pages over HTTP/2 without a browser. It stops at
+            # the first sign of blocking (403/429/503, a CAPTCHA or a page that
+            # doesn't parse); those pages and the rest go to Playwright below
+            urls_remaining = await self.fetch_without_browser(urls_remaining)
+            if not urls_remaining:
+                print("\nAll tracklists fetched without a browser")
+                return
+            print(f"\n{len(urls_remaining)} URLs left for the browser")
+            
             print("\n⚠️  Important: When you see a CAPTCHA:")
             print("1. Solve it in the browser window")
             print("2. Wait for the page to load")
@@ -342,6 +339,9 @@ class TracklistsSpider:
                     viewport={'width': 1920, 'height': 1080}
                 )
                 
+                # Only the HTML is parsed, skip images, styles, fonts and ads
+                await context.route('**/*', block_unneeded_requests)
+                
                 page = await context.new_page()
                 
                 # Process each URL with progress bar
@@ -354,8 +354,7 @@ class TracklistsSpider:
                             if tracklist:
                                 # Save parsed tracklist
                                 self.save_tracklist(tracklist)
-                                self.processed_urls.add(url)
-                                self.save_processed()
+                                self.save_processed(url)
                                 print(f"\nSaved tracklist: {url}")
                             else:
                                 print(f"\nFailed to parse: {url}")
@@ -377,9 +376,11 @@ class TracklistsSpider:
             traceback.print_exc()
             
         finally:
-            self.save_processed()
+            self.out_fp.close()
+            self.processed_fp.close()
 
 async def main():
+    logging.basicConfig(level=logging.INFO)
     spider = TracklistsSpider()
     await spider.run()
 
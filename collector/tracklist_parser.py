@@ -0,0 +1,88 @@
+import logging
+from typing import Dict, List, Optional
+
+from selectolax.lexbor import LexborHTMLParser
+
+logger = logging.getLogger(__name__)
+
+# Tracklist pages are parsed with selectolax's lexbor backend, which parses
+# and runs these selectors several times faster than lxml and cssselect
+EVENT_NAME_SELECTOR = 'meta[property="og:title"]'
+EVENT_TITLE_SELECTOR = '.tracklistTitle'  # Fallback when there's no og:title
+
+# Track divs: ids starting with "tlp", excluding the "..._content" divs
+TRACK_DIV_SELECTOR = 'div[id^="tlp"]:not([id$="_content"])'
+
+# Selectors matched within each track div
+TRACK_TITLE_SELECTOR = 'meta[itemprop="name"]'
+TRACK_TIME_SELECTOR = '.cueValueField'
+TRACK_ARTIST_SELECTOR = 'meta[itemprop="byArtist"]'
+TRACK_LABEL_SELECTOR = 'meta[itemprop="recordLabel"]'
+
+# Track number spans of tracks played together with the previous track,
+# matched once per page
+PLAYED_TOGETHER_SELECTOR = 'span[id$="_tracknumber_value"][title="played together with previous track"]'
+
+
+def parse_event_name(tree: LexborHTMLParser) -> Optional[str]:
+    """Get the event name from the meta tag, falling back to the title element."""
+    title_meta = tree.css_first(EVENT_NAME_SELECTOR)
+    if title_meta:
+        return title_meta.attributes.get('content')
+    title_el = tree.css_first(EVENT_TITLE_SELECTOR)
+    if title_el:
+        # Collapse the markup's newlines and indentation, like inner_text()
+        return ' '.join(title_el.text().split())
+    return None
+
+
+def parse_tracks(tree: LexborHTMLParser) -> List[Dict]:
+    """Parse every track on a tracklist page, in order and without duplicates."""
+    tracks = []
+    track_numbers = set()
+    played_together_ids = {span.attributes.get('id') for span in tree.css(PLAYED_TOGETHER_SELECTOR)}
+
+    # Checked once so per-track logging costs nothing unless debugging
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    for track_div in tree.css(TRACK_DIV_SELECTOR):
+        # Read the attributes once and slice off the "tlp" id prefix
+        attrib = track_div.attributes
+        track_id = attrib.get('id')
+        if not track_id:
+            logger.warning("Track div has no ID")
+            continue
+        track_number = track_id[3:]
+
+        if track_number in track_numbers:
+            if debug:
+                logger.debug("Skipping duplicate track number: %s", track_number)
+            continue
+        track_numbers.add(track_number)
+
+        # Strip text fields and leave out missing ones as they are read
+        track_data = {}
+        title = track_div.css_first(TRACK_TITLE_SELECTOR)
+        if title and title.attributes.get('content'):
+            track_data['title'] = title.attributes['content'].strip()
+        time = track_div.css_first(TRACK_TIME_SELECTOR)
+        time = time.text() if time else None
+        if time:
+            track_data['time'] = time.strip()
+        track_data['artist'] = [
+            artist.attributes['content'].strip()
+            for artist in track_div.css(TRACK_ARTIST_SELECTOR)
+            if artist.attributes.get('content')
+        ]
+        label = track_div.css_first(TRACK_LABEL_SELECTOR)
+        if label and label.attributes.get('content'):
+            track_data['record_label'] = label.attributes['content'].strip()
+        track_data['played_together'] = f"tlp{attrib.get('data-trno')}_tracknumber_value" in played_together_ids
+        track_data['is_mashup_element'] = 'data-mashpos' in attrib
+        track_data['track_number'] = track_number
+
+        tracks.append(track_data)
+        if debug:
+            logger.debug("Added track: %s", track_data)
+
+    return tracks
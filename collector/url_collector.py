@@ -1,15 +1,75 @@
 import asyncio
-import json
 from pathlib import Path
 from typing import Set
 import random
 import re
 import traceback
-import sys
 
-from playwright.async_api import async_playwright, Page
+import orjson
+from playwright.async_api import async_playwright, Page, TimeoutError as PlaywrightTimeoutError
 from tqdm import tqdm
 
+from collector.utils.browser import block_unneeded_requests
+from collector.utils.urls import BASE_URL, canonicalize_url
+
+# Eric Prydz's tracklist pages to collect from
+DJ_PAGE_URLS = [
+    'https://www.1001tracklists.com/dj/pryda/index.html',
+]
+MAX_CONCURRENT_PAGES = 4  # DJ pages loaded and collected at once
+
+# Tracklist links are site-relative, so a prefix match on the raw attribute is
+# enough; it's cheaper than a substring scan of every anchor's href
+TRACKLIST_LINK_SELECTOR = 'a[href^="/tracklist/"]'
+
+# Reports the hrefs of tracklist links added to the page to window.onNewUrls
+OBSERVE_TRACKLIST_LINKS_JS = '''selector => {
+    new MutationObserver(mutations => {
+        const found = new Set();
+        for (const mutation of mutations) {
+            for (const node of mutation.addedNodes) {
+                if (node.nodeType !== Node.ELEMENT_NODE) continue;
+                if (node.matches(selector)) found.add(node.getAttribute('href'));
+                for (const a of node.querySelectorAll(selector)) found.add(a.getAttribute('href'));
+            }
+        }
+        if (found.size) window.onNewUrls([...found]);
+    }).observe(document.body, {childList: true, subtree: true});
+}'''
+
+# Added to every page before its own scripts run. Scrolls by dy pixels with
+# natural easing and resolves with the final scroll position once the
+# animation ends, so no separate read is needed. Browsers pause
+# requestAnimationFrame on pages that aren't rendering, so a timer resolves
+# the promise if the animation stalls
+SMOOTH_SCROLL_JS = '''
+window.__smoothScrollBy = dy => new Promise(resolve => {
+    function easeInOutQuad(t) {
+        return t < 0.5 ? 2 * t * t : -1 + (4 - 2 * t) * t;
+    }
+    
+    const duration = 1000;
+    const start = window.pageYOffset;
+    const startTime = performance.now();
+    setTimeout(() => resolve(window.pageYOffset), duration + 500);
+    
+    function scroll() {
+        const currentTime = performance.now();
+        const time = Math.min(1, (currentTime - startTime) / duration);
+        
+        window.scrollTo(0, start + (dy * easeInOutQuad(time)));
+        
+        if (time < 1) {
+            requestAnimationFrame(scroll);
+        } else {
+            resolve(window.pageYOffset);
+        }
+    }
+    
+    scroll();
+});
+'''
+
 
 async def scroll_up_and_collect(page: Page) -> Set[str]:
     """
@@ -17,33 +77,40 @@ async def scroll_up_and_collect(page: Page) -> Set[str]:
     Returns set of collected URLs.
     """
     collected_urls = set()
+    
+    def add_urls(hrefs):
+        # Store canonical paths, so query strings and fragments don't
+        # produce duplicate entries
+        new_urls = {
+            canonicalize_url(url).removeprefix(BASE_URL)
+            for url in hrefs
+        } - collected_urls
+        
+        collected_urls.update(new_urls)
+        if new_urls:
+            print(f"New URLs found ({len(new_urls)}), {len(collected_urls)} unique so far:")
+            for url in list(new_urls)[:2]:
+                print(f"  {url}")
+    
     try:
+        # Links rendered while scrolling are pushed to Python by a
+        # MutationObserver as they appear, instead of re-querying every link
+        # on the page after each scroll
+        await page.expose_function('onNewUrls', add_urls)
+        await page.evaluate(OBSERVE_TRACKLIST_LINKS_JS, TRACKLIST_LINK_SELECTOR)
+        # Links already on the page, read once in a single call
+        add_urls(await page.locator(TRACKLIST_LINK_SELECTOR).evaluate_all(
+            'links => links.map(a => a.getAttribute("href"))'
+        ))
+        
         print("\nStarting upward scrolling and URL collection...")
+        # Stop early once scrolling stops turning up new links
+        prev_pos = None
+        prev_count = len(collected_urls)
+        stable_iters = 0
         for i in range(10):  
             print(f"Scroll attempt {i+1}/10")
             
-            # Collect URLs at current position
-            try:
-                new_urls = set()
-                links = await page.query_selector_all('a[href*="/tracklist/"]')
-                for link in links:
-                    url = await link.get_attribute('href')
-                    if url and '/tracklist/' in url:
-                        if url not in collected_urls:
-                            new_urls.add(url)
-                
-                collected_urls.update(new_urls)
-                print(f"Total unique URLs collected so far: {len(collected_urls)}")
-                if new_urls:
-                    print(f"New URLs found in this scroll ({len(new_urls)}):")
-                    for url in list(new_urls)[:2]:
-                        print(f"  {url}")
-            except Exception as e:
-                print(f"Error collecting URLs: {e}")
-            
-            # Get current scroll position
-            prev_pos = await page.evaluate('window.pageYOffset')
-            
             # Random mouse movement
             await page.mouse.move(
                 random.randint(100, 800),
@@ -53,47 +120,37 @@ async def scroll_up_and_collect(page: Page) -> Set[str]:
             # Random delay before scroll (0.5 to 2 seconds)
             await asyncio.sleep(random.uniform(0.5, 2))
             
-            # Scroll upward with natural easing
-            await page.evaluate('''() => {
-                function easeInOutQuad(t) {
-                    return t < 0.5 ? 2 * t * t : -1 + (4 - 2 * t) * t;
-                }
-                
-                const scrollAmount = -(Math.floor(Math.random() * 800) + 300);  // Random between -300 and -1100px
-                const duration = 1000;
-                const start = window.pageYOffset;
-                const startTime = performance.now();
-                
-                function scroll() {
-                    const currentTime = performance.now();
-                    const time = Math.min(1, (currentTime - startTime) / duration);
-                    
-                    window.scrollTo(0, start + (scrollAmount * easeInOutQuad(time)));
-                    
-                    if (time < 1) {
-                        requestAnimationFrame(scroll);
-                    }
-                }
-                
-                scroll();
-            }''')
+            # Scroll upward by a random 300 to 1100px with natural easing; the
+            # scroll function is already on the page, so only the call is sent
+            scroll_amount = -random.randint(300, 1099)
+            curr_pos = await page.evaluate('dy => window.__smoothScrollBy(dy)', scroll_amount)
             
-            # Random pause after scroll (1 to 3 seconds)
-            await asyncio.sleep(random.uniform(1, 3))
+            # Random pause after scroll (1 to 3 seconds, counting the 1 second
+            # the scroll itself took)
+            await asyncio.sleep(random.uniform(0, 2))
             
-            # Add longer pause every 5 scrolls
-            if (i + 1) % 5 == 0:
-                print("Taking a short break...")
-                await asyncio.sleep(random.uniform(3, 6))
-            
-            # Get current position for logging
-            curr_pos = await page.evaluate('window.pageYOffset')
             print(f"Current scroll position: {curr_pos}px")
             
             # If we've reached the top, we can stop
             if curr_pos <= 0:
                 print("Reached the top of the page")
                 break
+            if curr_pos == prev_pos:
+                print("Scrolling made no progress")
+                break
+            prev_pos = curr_pos
+            
+            # Links arrive from the observer while scrolling and pausing
+            stable_iters = stable_iters + 1 if len(collected_urls) == prev_count else 0
+            prev_count = len(collected_urls)
+            if stable_iters >= 2:
+                print("No new URLs in the last 2 scrolls")
+                break
+            
+            # Add longer pause every 5 scrolls
+            if (i + 1) % 5 == 0:
+                print("Taking a short break...")
+                await asyncio.sleep(random.uniform(3, 6))
         
         print("\nCompleted scrolling and collection sequence")
         return collected_urls
@@ -106,60 +163,90 @@ async def scroll_up_and_collect(page: Page) -> Set[str]:
 
 async def wait_for_user_input():
     """Wait for user input in an async-friendly way."""
-    print("\nManual scrolling mode activated!")
-    print("Please manually scroll to the bottom of the page.")
-    print("Once you've reached the bottom and solved any CAPTCHA, press Enter to begin collection...")
+    print(
+        "\nManual scrolling mode activated!\n"
+        "Please manually scroll to the bottom of each page.\n"
+        "Once you've reached the bottom and solved any CAPTCHA, press Enter to begin collection...",
+        flush=True
+    )
     return await asyncio.get_event_loop().run_in_executor(None, input)
 
 
 def save_urls_to_file(urls: Set[str]) -> None:
     """Save URLs to JSON file."""
-    urls_list = sorted(list(urls))  # Convert to sorted list for consistent ordering
     urls_file = Path('raw_data/tracklist_urls.json')
     
     # Ensure directory exists
     urls_file.parent.mkdir(parents=True, exist_ok=True)
     
-    # Save URLs
-    with urls_file.open('w', encoding='utf-8') as f:
-        json.dump(urls_list, f, indent=2)
+    # Save URLs, sorted for consistent ordering. orjson encodes straight to
+    # bytes, without building an intermediate str
+    urls_file.write_bytes(orjson.dumps(sorted(urls), option=orjson.OPT_INDENT_2))
+
+
+class Collector:
+    """Browser session reused for every DJ page the collector opens."""
+    
+    async def __aenter__(self):
+        print("Launching browser...", flush=True)
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(
+            headless=False,
+            args=[
+                '--disable-dev-shm-usage',
+                '--disable-blink-features=AutomationControlled',
+                '--disable-automation',
+                '--no-sandbox'
+            ]
+        )
+        
+        # One context for every page, so a CAPTCHA solved once clears them all
+        self.context = await self.browser.new_context(
+            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15',
+            viewport={'width': 1920, 'height': 1080}
+        )
+        await self.context.route('**/*', block_unneeded_requests)
+        await self.context.add_init_script(SMOOTH_SCROLL_JS)
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.browser.close()
+        await self.playwright.stop()
+    
+    async def open_dj_page(self, url: str, semaphore: asyncio.Semaphore) -> Page:
+        """Open a DJ page and wait for its tracklist links."""
+        async with semaphore:
+            page = await self.context.new_page()
+            
+            print(f"Navigating to {url}...", flush=True)
+            # Wait for the tracklist links themselves rather than network idle,
+            # which also waits on analytics beacons
+            await page.goto(url, wait_until='domcontentloaded')
+            try:
+                await page.wait_for_selector(TRACKLIST_LINK_SELECTOR, state='attached')
+            except PlaywrightTimeoutError:
+                # Most likely a CAPTCHA; the operator solves it at the prompt
+                print(f"No tracklist links on {url} yet, continuing to the prompt", flush=True)
+            return page
+    
+    async def collect(self, page: Page, semaphore: asyncio.Semaphore) -> Set[str]:
+        """Collect URLs from an opened DJ page while scrolling up."""
+        async with semaphore:
+            return await scroll_up_and_collect(page)
 
 
 async def main():
     print("Starting URL collector...", flush=True)
     try:
-        async with async_playwright() as p:
-            print("Launching browser...", flush=True)
-            browser = await p.chromium.launch(
-                headless=False,
-                args=[
-                    '--disable-dev-shm-usage',
-                    '--disable-blink-features=AutomationControlled',
-                    '--disable-automation',
-                    '--no-sandbox'
-                ]
-            )
+        async with Collector() as collector:
+            # Pages load and are collected concurrently, a few at a time
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_PAGES)
+            pages = await asyncio.gather(*[collector.open_dj_page(url, semaphore) for url in DJ_PAGE_URLS])
             
-            context = await browser.new_context(
-                user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15',
-                viewport={'width': 1920, 'height': 1080}
-            )
-            
-            page = await context.new_page()
-            
-            print("Navigating to Eric Prydz's tracklists page...", flush=True)
-            # Navigate to the page
-            await page.goto('https://www.1001tracklists.com/dj/pryda/index.html', wait_until='networkidle')
-            await asyncio.sleep(2)
-            
-            print("\nManual scrolling mode activated!", flush=True)
-            print("Please manually scroll to the bottom of the page.", flush=True)
-            print("Once you've reached the bottom and solved any CAPTCHA, press Enter to begin collection...", flush=True)
-            sys.stdout.flush()
-            await asyncio.get_event_loop().run_in_executor(None, input)
+            await wait_for_user_input()
             
             # Collect URLs while scrolling up
-            collected_urls = await scroll_up_and_collect(page)
+            collected_urls = set().union(*await asyncio.gather(*[collector.collect(page, semaphore) for page in pages]))
             
             # Save the collected URLs
             if collected_urls:
@@ -169,8 +256,6 @@ async def main():
             else:
                 print("\nNo URLs were collected!")
             
-            await browser.close()
-            
     except Exception as e:
         print(f"Error in main: {e}")
         traceback.print_exc()
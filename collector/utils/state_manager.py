@@ -1,57 +1,125 @@
-import json
+import orjson
+import sqlite3
 from pathlib import Path
 from datetime import datetime
 
+from collector.utils.urls import canonicalize_url
+
 class StateManager:
-    def __init__(self, state_file='scrape_state.json', output_file='tracklists.json'):
-        self.state_file = Path(state_file)
-        self.output_file = Path(output_file)
-        self.state = self._load_state()
-        self.existing_tracklists = self._load_existing_tracklists()
-        self.empty_tracklists = self._load_empty_tracklists()
-
-    def _load_empty_tracklists(self):
-        return {url for url, data in self.existing_tracklists.items() if not data['tracks']}
-
-    def _load_state(self):
-        if self.state_file.exists():
-            with open(self.state_file) as f:
-                state_data = json.load(f)
-            # Convert the loaded list back to a set
-            state_data['scraped_urls'] = set(state_data['scraped_urls'])
-            return state_data
-        return {
-            'last_run': None,
-            'scraped_urls': set(),  # Initialize as a set instead of list
-            'total_tracklists': 0
-    }
-
-    def _load_existing_tracklists(self):
-        if self.output_file.exists():
-            with open(self.output_file) as f:
-                data = json.load(f)
-                return {item['url']: item for item in data}
-        return {}
+    """Scrape state kept in a SQLite database in WAL mode.
+
+    Tracklists and scraped URLs are indexed by canonical URL, so membership
+    checks are a single lookup and nothing has to be held in memory. State
+    left in the older JSON files is imported once, into a new database.
+    """
+
+    def __init__(self, db_file='state.db', state_file='scrape_state.json', output_file='tracklists.jsonl'):
+        self.db_file = Path(db_file)
+        # Autocommit; batches open their own transaction
+        self.conn = sqlite3.connect(self.db_file, isolation_level=None)
+        # WAL only syncs on checkpoints, not on every commit
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tracklists (
+                url TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                track_count INTEGER NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS scraped (
+                url TEXT PRIMARY KEY,
+                ts TEXT NOT NULL
+            );
+        """)
+        # user_version marks a database the old files were imported into
+        version, = self.conn.execute('PRAGMA user_version').fetchone()
+        if version == 0:
+            self._import_legacy_files(Path(state_file), Path(output_file))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def empty_tracklists(self):
+        rows = self.conn.execute('SELECT url FROM tracklists WHERE track_count = 0')
+        return {url for url, in rows}
+
+    @property
+    def state(self):
+        last_run, = self.conn.execute('SELECT MAX(ts) FROM scraped').fetchone()
+        total_tracklists, = self.conn.execute('SELECT COUNT(*) FROM tracklists').fetchone()
+        return {'last_run': last_run, 'total_tracklists': total_tracklists}
 
     def is_url_scraped(self, url):
-        return url in self.existing_tracklists
+        row = self.conn.execute(
+            'SELECT 1 FROM tracklists WHERE url = ?', (canonicalize_url(url),)
+        ).fetchone()
+        return row is not None
 
     def add_tracklist(self, tracklist_data):
-        self.existing_tracklists[tracklist_data['url']] = tracklist_data
-        self._save_tracklists()
-        self._update_state(tracklist_data['url'])
-
-    def _save_tracklists(self):
-        with open(self.output_file, 'w') as f:
-            json.dump(list(self.existing_tracklists.values()), f, indent=2)
-
-    def _update_state(self, url):
-        self.state['scraped_urls'].add(url)  # Using set's add() method
-        self.state['last_run'] = datetime.now().isoformat()
-        self.state['total_tracklists'] = len(self.existing_tracklists)
-        
-        with open(self.state_file, 'w') as f:
-            # Convert set to list for JSON serialization
-            state_copy = self.state.copy()
-            state_copy['scraped_urls'] = list(state_copy['scraped_urls'])
-            json.dump(state_copy, f, indent=2)
\ No newline at end of file
+        self.add_tracklists([tracklist_data])
+
+    def add_tracklists(self, tracklists):
+        """Store tracklists and mark their URLs scraped in one transaction."""
+        now = datetime.now().isoformat()
+        rows = [
+            (canonicalize_url(tracklist['url']), orjson.dumps(tracklist).decode(), len(tracklist['tracks']))
+            for tracklist in tracklists
+        ]
+        with self.conn:
+            self.conn.execute('BEGIN')
+            # A tracklist added again replaces the earlier one
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO tracklists (url, data, track_count) VALUES (?, ?, ?)', rows
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO scraped (url, ts) VALUES (?, ?)', [(url, now) for url, _, _ in rows]
+            )
+
+    def _import_legacy_files(self, state_file, output_file):
+        """Import the JSON state and tracklist files used before the database."""
+        state = {}
+        if state_file.exists():
+            with open(state_file, 'rb') as f:
+                state = orjson.loads(f.read())
+        # Older state files list the scraped URLs themselves, later ones log
+        # them next to the state file
+        scraped_urls = set(state.get('scraped_urls', []))
+        scraped_urls_file = state_file.with_name('scraped_urls.log')
+        if scraped_urls_file.exists():
+            with open(scraped_urls_file, encoding='utf-8') as f:
+                scraped_urls.update(line.strip() for line in f if line.strip())
+
+        # Tracklists were first kept as one JSON array, then one per line; a
+        # tracklist added again later replaces the earlier one
+        tracklists = []
+        json_file = output_file.with_suffix('.json')
+        if json_file.exists():
+            with open(json_file, 'rb') as f:
+                tracklists.extend(orjson.loads(f.read()))
+        if output_file.suffix != '.json' and output_file.exists():
+            with open(output_file, 'rb') as f:
+                tracklists.extend(orjson.loads(line) for line in f if line.strip())
+
+        with self.conn:
+            self.conn.execute('BEGIN')
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO tracklists (url, data, track_count) VALUES (?, ?, ?)',
+                [
+                    (canonicalize_url(tracklist['url']), orjson.dumps(tracklist).decode(), len(tracklist['tracks']))
+                    for tracklist in tracklists
+                ]
+            )
+            ts = state.get('last_run') or datetime.now().isoformat()
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO scraped (url, ts) VALUES (?, ?)',
+                [(canonicalize_url(url), ts) for url in scraped_urls]
+            )
+            self.conn.execute('PRAGMA user_version = 1')
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,36 @@
+import gzip
+from pathlib import Path
+
+import orjson
+
+from collector.utils.urls import canonicalize_url
+
+# Where the spiders save tracklists: the Playwright spider's JSON Lines file,
+# then the reference spider's gzipped feed
+TRACKLIST_FILES = (
+    Path('raw_data/tracklists.jsonl'),
+    Path('raw_data/tracklists.jsonl.gz'),
+)
+
+
+def iter_tracklists(path):
+    """Yield tracklists from a JSON Lines file, gzipped or not, one line at a time."""
+    # The feed appends a gzip member per run, which gzip reads as one stream
+    opener = gzip.open if Path(path).suffix == '.gz' else open
+    with opener(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
+
+
+def iter_saved_tracklists(paths=TRACKLIST_FILES):
+    """Yield tracklists from every file that exists, the first one seen per URL."""
+    seen_urls = set()
+    for path in paths:
+        if not Path(path).exists():
+            continue
+        for tracklist in iter_tracklists(path):
+            url = canonicalize_url(tracklist['url'])
+            if url not in seen_urls:
+                seen_urls.add(url)
+                yield tracklist
@@ -0,0 +1,22 @@
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+BASE_URL = 'https://www.1001tracklists.com'
+
+# Query parameters that only track where a link came from
+TRACKING_PARAMS = {'ref', 'origin', 'callback'}
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a tracklist URL so variants of the same page compare equal.
+
+    Relative hrefs are resolved against the site, the host is lowercased, and
+    the fragment, tracking parameters and any trailing slash are dropped.
+    """
+    parts = urlsplit(urljoin(BASE_URL, url.strip()))
+    query = urlencode([
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.startswith('utm_') and key not in TRACKING_PARAMS
+    ])
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ''))